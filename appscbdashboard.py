@@ -1,9 +1,34 @@
+# =========================================================
+# PERFORMANCE NOTES (see perf_notes.md for details)
+# =========================================================
+# Every hot path here is memory- or serialization-bound, not
+# compute-bound. The four bottlenecks and the technique each one got:
+#   1. Upload parsing      -> calamine / pyarrow engines + st.cache_data
+#   2. Figure serialization-> downsampling + Scattergl + orjson + restyle
+#   3. Streamlit reruns    -> filter form, cached helpers, Parquet store
+#   4. Filtering/masking   -> searchsorted slices, numexpr/numba block ops
+# SIMD-level micro-optimization is not worth pursuing in this app;
+# reduce passes over memory and bytes over the wire instead.
+# =========================================================
+
 import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
+import plotly.io as pio
+import hashlib
 import io
-from datetime import timedelta
+import os
+import tempfile
+from uuid import uuid4
+
+# orjson encodes the large trace arrays roughly 2x faster than the
+# stdlib encoder; plotly falls back silently if it is not installed.
+try:
+    import orjson  # noqa: F401
+    pio.json.config.default_engine = "orjson"
+except ImportError:
+    pass
 
 # =========================================================
 # PAGE CONFIG
@@ -59,6 +84,15 @@ def generate_dc_template():
         "STRINGS": [24, 24]
     })
 
+# Templates never change, so the CSV text and openpyxl workbook bytes
+# are built once instead of on every welcome-page rerun.
+@st.cache_data(show_spinner=False)
+def template_files(kind):
+    df = generate_cb_template() if kind == "cb" else generate_dc_template()
+    buf = io.BytesIO()
+    df.to_excel(buf, index=False)
+    return df.to_csv(index=False), buf.getvalue()
+
 # =========================================================
 # FILE VALIDATION
 # =========================================================
@@ -80,36 +114,256 @@ def validate_dc_file(df):
 # =========================================================
 # DATA LOADERS
 # =========================================================
-def load_cb_file(file):
-    df = pd.read_csv(file) if file.name.endswith("csv") else pd.read_excel(file)
-    df["DATETIME"] = pd.to_datetime(df["Date"] + " " + df["Time"])
-    return df.drop(columns=["Date", "Time"])
+# Loaders are keyed on the raw upload bytes so Streamlit parses each
+# unique file once instead of on every rerun.
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+# calamine (Rust) parses XLSX an order of magnitude faster than
+# openpyxl's pure-Python XML walk; fall back when it isn't installed.
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = None
+
+@st.cache_data(show_spinner=False)
+def parse_upload(data, name):
+    buf = io.BytesIO(data)
+    if name.endswith("csv"):
+        if HAS_PYARROW:
+            return pd.read_csv(buf, engine="pyarrow")
+        return pd.read_csv(buf, low_memory=False, cache_dates=True)
+    return pd.read_excel(buf, engine=EXCEL_ENGINE)
+
+@st.cache_data(show_spinner=False)
+def load_cb_file(data, name):
+    df = parse_upload(data, name)
+    # Explicit format + cache keeps pandas on the C fast-path instead of
+    # per-row dateutil inference; dates repeat so the cache hit rate is high.
+    df["DATETIME"] = (
+        pd.to_datetime(df["Date"].astype(str), format="%Y-%m-%d", cache=True)
+        + pd.to_timedelta(df["Time"].astype(str))
+    )
+    df.drop(columns=["Date", "Time"], inplace=True)
+    # Kept sorted by DATETIME so date-range filtering can binary-search
+    # instead of scanning.
+    df.sort_values("DATETIME", inplace=True)
+    df.reset_index(drop=True, inplace=True)
+    # float32 is plenty for current readings (~0-200 A) and halves both
+    # DataFrame memory and the plotly payload sent to the browser.
+    cb_cols = df.columns[df.columns.str.startswith("CB_CURRENT")]
+    df[cb_cols] = df[cb_cols].astype(np.float32, copy=False)
+    # The SCB column list never changes after load; stash it so reruns
+    # don't rescan hundreds of column names.
+    df.attrs["scb_cols"] = list(cb_cols)
+    return df
 
-def load_dc_file(file):
-    df = pd.read_csv(file) if file.name.endswith("csv") else pd.read_excel(file)
+@st.cache_data(show_spinner=False)
+def load_dc_file(data, name):
+    df = parse_upload(data, name)
+    df["STRINGS"] = df["STRINGS"].astype(np.int32)
     return df.set_index("CB_INDEX")
 
+def cb_store_id():
+    # Session-unique id: st.cache_data is process-global, so anything
+    # cached per-session must carry this in its key.
+    if "cb_store_id" not in st.session_state:
+        st.session_state.cb_store_id = uuid4().hex
+    return st.session_state.cb_store_id
+
+def cb_parquet_path():
+    # One file per session: a shared fixed path would let concurrent
+    # users overwrite (and be served) each other's uploads.
+    return os.path.join(tempfile.gettempdir(),
+                        f"scb_cb_{cb_store_id()}.parquet")
+
+def store_cb_frame(df):
+    # With pyarrow the frame lives on disk as Parquet and reruns read
+    # back just the columns they plot; only the DATETIME array and the
+    # column list stay in session state. Without pyarrow the whole frame
+    # stays in memory as before.
+    st.session_state.cb_dt = df["DATETIME"].to_numpy()
+    st.session_state.scb_cols = get_scb_columns(df)
+    st.session_state.cb_token = st.session_state.get("cb_token", 0) + 1
+    if HAS_PYARROW:
+        # Re-uploads rewrite the session's own file in place.
+        pq.write_table(pa.Table.from_pandas(df), cb_parquet_path(),
+                       compression="zstd")
+        st.session_state.cb_df = None
+    else:
+        st.session_state.cb_df = df
+
+# Keyed on (path, columns, token): the per-session path keeps sessions
+# from sharing cache entries, the token invalidates on re-upload.
+@st.cache_data(show_spinner=False)
+def read_cb_columns(path, columns, token):
+    return pq.read_table(path, columns=list(columns)).to_pandas()
+
+def get_cb_frame(columns):
+    if st.session_state.cb_df is not None:
+        return st.session_state.cb_df[columns]
+    return read_cb_columns(cb_parquet_path(), tuple(columns),
+                           st.session_state.cb_token)
+
 # =========================================================
 # ANALYTICS HELPERS
 # =========================================================
+try:
+    import numexpr as ne
+    HAS_NUMEXPR = True
+except ImportError:
+    HAS_NUMEXPR = False
+
+# Below this many elements numexpr's thread startup costs more than it saves.
+NUMEXPR_MIN_SIZE = 100_000
+
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+if HAS_NUMBA:
+    # Fused threshold + normalize: each element is read once, compared,
+    # scaled and written, instead of separate mask and divide passes.
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _clip_and_norm(block, thr, strings_inv, out):
+        for j in prange(block.shape[1]):
+            inv = strings_inv[j]
+            for i in range(block.shape[0]):
+                v = block[i, j]
+                out[i, j] = 0.0 if v > thr else v * inv
+
 def get_scb_columns(df):
-    return [c for c in df.columns if c.startswith("CB_CURRENT")]
+    # Filled in by load_cb_file; attrs survive the dashboard's slicing,
+    # so this is a dict lookup instead of a column scan. The fallback
+    # covers frames that didn't come through the loader.
+    cols = df.attrs.get("scb_cols")
+    if cols is None:
+        cols = [c for c in df.columns if c.startswith("CB_CURRENT")]
+    return cols
 
 def apply_threshold(df, scbs, threshold):
-    df = df.copy()
-    for scb in scbs:
-        df[scb] = np.where(df[scb] > threshold, 0, df[scb])
-    return df
-
-def remove_inactive(df, scbs):
-    return [s for s in scbs if not (df[s] == 0).all()]
+    if not scbs:
+        return df
+    # Single 2-D mask over the selected block: one pass over memory
+    # instead of a boolean mask + new column per SCB. On large frames
+    # numexpr fuses compare+select and runs it multi-threaded.
+    thr = np.float32(threshold)
+    block = df[scbs].to_numpy()
+    if HAS_NUMEXPR and block.size > NUMEXPR_MIN_SIZE:
+        zero = np.float32(0)
+        block = ne.evaluate(
+            "where(block > thr, zero, block)",
+            local_dict={"block": block, "thr": thr, "zero": zero},
+        )
+    else:
+        # Out-of-place: under copy-on-write, to_numpy() on a sliced frame
+        # returns a read-only view that in-place masking would crash on.
+        block = np.where(block > thr, np.float32(0), block)
+    # Shallow copy: untouched columns stay shared with the input, only
+    # the clipped block gets fresh storage.
+    out = df.copy(deep=False)
+    out[scbs] = block
+    return out
+
+# Threshold + optional normalization as one cached step, so re-toggling
+# View Mode or re-rendering with unchanged filters is a cache hit.
+@st.cache_data(show_spinner=False)
+def prepare_plot_df(_df, _dc_df, scbs, threshold, mode, cache_key=None):
+    normalize = mode == "Normalized Current" and bool(scbs)
+    if normalize:
+        # SCBs missing from the DC file keep their raw values, as before.
+        strings = _dc_df["STRINGS"].reindex(scbs).fillna(1).to_numpy(np.float32)
+        if HAS_NUMBA:
+            block = np.ascontiguousarray(_df[scbs].to_numpy(np.float32))
+            clipped = np.empty_like(block)
+            _clip_and_norm(block, np.float32(threshold),
+                           np.float32(1) / strings, clipped)
+            out = _df.copy(deep=False)
+            out[scbs] = clipped
+            return out
+    out = apply_threshold(_df, scbs, threshold)
+    if normalize:
+        # One broadcasted divide across the block.
+        out[scbs] = out[scbs].to_numpy() / strings
+    return out
+
+# _df is unhashed; cache_key carries the df identity + date range.
+@st.cache_data(show_spinner=False)
+def remove_inactive(_df, scbs, cache_key=None):
+    if not scbs:
+        return []
+    # One vectorized reduction over the whole block instead of a
+    # per-column Python loop.
+    active = (_df[scbs].to_numpy() != 0).any(axis=0)
+    return [s for s, a in zip(scbs, active) if a]
+
+try:
+    from tsdownsample import MinMaxLTTBDownsampler
+    HAS_TSDOWNSAMPLE = True
+except ImportError:
+    HAS_TSDOWNSAMPLE = False
+
+# Points per trace actually sent to the browser; more than ~2 per pixel
+# is invisible anyway.
+MAX_PLOT_POINTS = 2000
+
+def downsample_indices(y, n_out=MAX_PLOT_POINTS):
+    if len(y) <= n_out:
+        return None
+    if HAS_TSDOWNSAMPLE:
+        return MinMaxLTTBDownsampler().downsample(y, n_out=n_out)
+    # Fallback: keep the min and max of each bucket, which preserves the
+    # spikes and dropouts a plain stride would hide.
+    n_bins = n_out // 2
+    width = len(y) // n_bins
+    view = y[:n_bins * width].reshape(n_bins, width)
+    offsets = np.arange(n_bins) * width
+    parts = [view.argmin(axis=1) + offsets,
+             view.argmax(axis=1) + offsets]
+    # The reshape drops up to width-1 trailing points; keep the tail's
+    # min/max too so the newest data is always represented.
+    tail = y[n_bins * width:]
+    if len(tail):
+        base = n_bins * width
+        parts.append(np.array([base + tail.argmin(), base + tail.argmax()]))
+    idx = np.concatenate(parts)
+    idx.sort()
+    return idx
 
 def plot_timeseries(df, scbs):
-    fig = go.Figure()
+    x = df["DATETIME"].to_numpy()
+    traces = []
     for scb in scbs:
-        fig.add_trace(go.Scatter(
-            x=df["DATETIME"],
-            y=df[scb],
+        y = df[scb].to_numpy()
+        idx = downsample_indices(y)
+        traces.append((x, y) if idx is None else (x[idx], y[idx]))
+
+    fig = st.session_state.get("fig")
+    if fig is not None and [t.name for t in fig.data] == list(scbs):
+        # Same traces as last render: swap just the arrays. This only
+        # saves Python-side figure construction — st.plotly_chart still
+        # reserializes and resends the full figure JSON every rerun, so
+        # don't build on this expecting a client-side restyle.
+        with fig.batch_update():
+            for trace, (xs, ys) in zip(fig.data, traces):
+                trace.x = xs
+                trace.y = ys
+        return fig
+
+    fig = go.Figure()
+    # Scattergl renders via WebGL instead of one SVG node per point,
+    # which keeps the browser responsive well past 100k points.
+    for scb, (xs, ys) in zip(scbs, traces):
+        fig.add_trace(go.Scattergl(
+            x=xs,
+            y=ys,
             mode="lines",
             name=scb
         ))
@@ -123,6 +377,7 @@ def plot_timeseries(df, scbs):
         paper_bgcolor=WHITE_BG,
         font=dict(color=TEXT_DARK)
     )
+    st.session_state.fig = fig
     return fig
 
 # =========================================================
@@ -148,25 +403,21 @@ def welcome_page():
 
     st.subheader("Download Templates")
 
-    cb_t = generate_cb_template()
-    dc_t = generate_dc_template()
+    cb_csv, cb_xlsx = template_files("cb")
+    dc_csv, dc_xlsx = template_files("dc")
 
     c1, c2 = st.columns(2)
 
     with c1:
-        st.download_button("⬇ CB Current Template (CSV)", cb_t.to_csv(index=False),
+        st.download_button("⬇ CB Current Template (CSV)", cb_csv,
                            "cb_template.csv", "text/csv")
-        buf = io.BytesIO()
-        cb_t.to_excel(buf, index=False)
-        st.download_button("⬇ CB Current Template (XLSX)", buf.getvalue(),
+        st.download_button("⬇ CB Current Template (XLSX)", cb_xlsx,
                            "cb_template.xlsx")
 
     with c2:
-        st.download_button("⬇ DC Capacity Template (CSV)", dc_t.to_csv(index=False),
+        st.download_button("⬇ DC Capacity Template (CSV)", dc_csv,
                            "dc_template.csv", "text/csv")
-        buf = io.BytesIO()
-        dc_t.to_excel(buf, index=False)
-        st.download_button("⬇ DC Capacity Template (XLSX)", buf.getvalue(),
+        st.download_button("⬇ DC Capacity Template (XLSX)", dc_xlsx,
                            "dc_template.xlsx")
 
     st.markdown("<br>", unsafe_allow_html=True)
@@ -178,11 +429,16 @@ def welcome_page():
 
     if cb_file:
         try:
-            df = pd.read_csv(cb_file) if cb_file.name.endswith("csv") else pd.read_excel(cb_file)
-            ok, msg = validate_cb_file(df)
+            data = cb_file.getvalue()
+            ok, msg = validate_cb_file(parse_upload(data, cb_file.name))
             if ok:
                 st.success("✔ " + msg)
-                st.session_state.cb_df = load_cb_file(cb_file)
+                # The uploader holds the file across reruns; only rewrite
+                # the (expensive) Parquet store when the bytes changed.
+                digest = hashlib.sha256(data).hexdigest()
+                if st.session_state.get("cb_digest") != digest:
+                    store_cb_frame(load_cb_file(data, cb_file.name))
+                    st.session_state.cb_digest = digest
                 cb_ok = True
             else:
                 st.error("❌ " + msg)
@@ -191,11 +447,17 @@ def welcome_page():
 
     if dc_file:
         try:
-            df = pd.read_csv(dc_file) if dc_file.name.endswith("csv") else pd.read_excel(dc_file)
-            ok, msg = validate_dc_file(df)
+            data = dc_file.getvalue()
+            ok, msg = validate_dc_file(parse_upload(data, dc_file.name))
             if ok:
                 st.success("✔ " + msg)
-                st.session_state.dc_df = load_dc_file(dc_file)
+                # dc_token identifies the DC upload in cache keys, since
+                # the frame itself is excluded from hashing downstream.
+                digest = hashlib.sha256(data).hexdigest()
+                if st.session_state.get("dc_digest") != digest:
+                    st.session_state.dc_df = load_dc_file(data, dc_file.name)
+                    st.session_state.dc_token = st.session_state.get("dc_token", 0) + 1
+                    st.session_state.dc_digest = digest
                 dc_ok = True
             else:
                 st.error("❌ " + msg)
@@ -312,61 +574,85 @@ def dashboard_page():
         st.image(LOGO_URL, width=140)
         st.markdown("## Filters")
 
-        threshold = st.number_input(
-            "Current Threshold",
-            value=200.0,
-            help="If Current > Threshold → value treated as 0"
-        )
-
-        date_option = st.selectbox(
-            "Date Range",
-            ["All", "Today", "Last 7 Days", "Last 15 Days", "Custom"]
-        )
-
-        df = st.session_state.cb_df.copy()
-
-        if date_option == "Custom":
-            start_date = st.date_input("Start Date")
-            end_date = st.date_input("End Date")
-            df = df[
-                (df["DATETIME"].dt.date >= start_date) &
-                (df["DATETIME"].dt.date <= end_date)
-            ]
-        elif date_option != "All":
-            max_dt = df["DATETIME"].max()
-            days = {"Today": 0, "Last 7 Days": 7, "Last 15 Days": 15}[date_option]
-            df = df[df["DATETIME"] >= max_dt - timedelta(days=days)]
-
-        scbs = get_scb_columns(df)
-
-        if st.checkbox("Remove Inactive SCBs"):
-            scbs = remove_inactive(df, scbs)
-
-        st.markdown("### Select SCBs")
-
-        if st.button("Select All"):
-            st.session_state.selected_scbs = scbs.copy()
-
-        if st.button("Clear All"):
-            st.session_state.selected_scbs = []
-
-        st.markdown("<div style='max-height:280px; overflow-y:auto;'>", unsafe_allow_html=True)
-
-        selected = []
-        for scb in scbs:
-            if st.checkbox(scb, value=scb in st.session_state.selected_scbs):
-                selected.append(scb)
+        # Select All / Clear All queue their selection on the previous
+        # run; it has to be applied before the multiselect instantiates.
+        if "pending_scbs" in st.session_state:
+            st.session_state.selected_scbs = st.session_state.pop("pending_scbs")
+
+        # The form coalesces filter edits into one rerun on Apply instead
+        # of a full script rerun per widget change.
+        with st.form("filters"):
+            threshold = st.number_input(
+                "Current Threshold",
+                value=200.0,
+                help="If Current > Threshold → value treated as 0"
+            )
+
+            date_option = st.selectbox(
+                "Date Range",
+                ["All", "Today", "Last 7 Days", "Last 15 Days", "Custom"]
+            )
+
+            # The frame itself is not touched here: date filtering is two
+            # binary searches on the stored DATETIME array, and the SCB
+            # list comes straight from session state. Column data is only
+            # read (from Parquet) for the SCBs that actually need it.
+            dt = st.session_state.cb_dt
+            # The store id keeps the key session-unique — the token alone
+            # restarts at 1 in every session and would collide across users.
+            frame_key = (cb_store_id(), st.session_state.cb_token, date_option)
+            lo, hi = 0, len(dt)
+
+            if date_option == "Custom":
+                start_date = st.date_input("Start Date")
+                end_date = st.date_input("End Date")
+                frame_key += (start_date, end_date)
+                lo = dt.searchsorted(np.datetime64(start_date))
+                hi = dt.searchsorted(np.datetime64(end_date) + np.timedelta64(1, "D"))
+            elif date_option != "All" and len(dt):
+                days = {"Today": 0, "Last 7 Days": 7, "Last 15 Days": 15}[date_option]
+                lo = dt.searchsorted(dt[-1] - np.timedelta64(days, "D"))
+
+            scbs = st.session_state.scb_cols
+
+            if st.checkbox("Remove Inactive SCBs"):
+                scbs = remove_inactive(get_cb_frame(scbs).iloc[lo:hi],
+                                       scbs, cache_key=frame_key)
+
+            st.markdown("### Select SCBs")
+
+            # Drop stale selections before the widget renders; a stored
+            # value missing from options would otherwise raise.
+            valid = [s for s in st.session_state.selected_scbs if s in scbs]
+            if valid != st.session_state.selected_scbs:
+                st.session_state.selected_scbs = valid
+
+            # One multiselect instead of a checkbox per SCB: a single widget
+            # round-trip per change rather than O(S) widgets per rerun.
+            st.multiselect(
+                "SCBs",
+                options=scbs,
+                key="selected_scbs",
+                label_visibility="collapsed"
+            )
+
+            st.form_submit_button("Apply", use_container_width=True)
+
+        c1, c2 = st.columns(2)
+
+        if c1.button("Select All"):
+            st.session_state.pending_scbs = scbs.copy()
+            st.rerun()
 
-        st.markdown("</div>", unsafe_allow_html=True)
-        st.session_state.selected_scbs = selected
+        if c2.button("Clear All"):
+            st.session_state.pending_scbs = []
+            st.rerun()
 
         if st.button("Back to Home"):
             st.session_state.page = "WELCOME"
             st.rerun()
 
     # ---------- MAIN CONTENT ----------
-    df = apply_threshold(df, st.session_state.selected_scbs, threshold)
-
     st.markdown("**View Mode**")
 
     mode = st.radio(
@@ -376,16 +662,24 @@ def dashboard_page():
         label_visibility="collapsed"
     )
 
-    plot_df = df.copy()
-
-    if mode == "Normalized Current":
-        for scb in st.session_state.selected_scbs:
-            if scb in st.session_state.dc_df.index:
-                plot_df[scb] /= st.session_state.dc_df.loc[scb, "STRINGS"]
+    selected = st.session_state.selected_scbs
+    df = get_cb_frame(["DATETIME"] + selected).iloc[lo:hi]
+
+    # _dc_df is unhashed, so the DC upload token has to ride in the key
+    # or a changed DC file could serve stale normalized results.
+    plot_df = prepare_plot_df(
+        df,
+        st.session_state.dc_df,
+        selected,
+        threshold,
+        mode,
+        cache_key=frame_key + (st.session_state.get("dc_token", 0),)
+    )
 
-    fig = plot_timeseries(plot_df, st.session_state.selected_scbs)
+    fig = plot_timeseries(plot_df, selected)
 
-    st.plotly_chart(fig, use_container_width=True)
+    # Stable key so Streamlit reuses the chart element across reruns.
+    st.plotly_chart(fig, use_container_width=True, key="main_chart")
 
 # =========================================================
 # ROUTER